@@ -1,17 +1,172 @@
 import asyncio
 import json
-import uuid
-from distutils.version import StrictVersion
-from typing import Any, Callable, Optional
+import os
+import sys
+from types import ModuleType
+from typing import (Any, Awaitable, Callable, Dict, List, Optional, Set, TYPE_CHECKING,
+                    Union, cast)
 
 from aiohttp import web
 
-from . import AbstractStorage, Session
+from . import AbstractStorage, Session, _SessionData
 
-try:
+if sys.version_info >= (3, 8):
+    from typing import TypedDict
+else:
+    from typing_extensions import TypedDict
+
+if TYPE_CHECKING:
     import aioredis
+else:
+    # Imported by the first RedisStorage() to keep module import cheap
+    aioredis = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+
+def _json_dumps(obj: object) -> bytes:
+    return json.dumps(obj).encode('utf-8')
+
+
+_default_encoder: Callable[[object], bytes]
+_default_decoder: Callable[[bytes], Any]
+
+try:
+    import orjson
 except ImportError:  # pragma: no cover
-    aioredis = None  # type: ignore[assignment]
+    _default_encoder = _json_dumps
+    _default_decoder = json.loads
+else:
+    def _orjson_dumps(obj: object) -> bytes:
+        try:
+            # Non-str keys are stringified the same way json.dumps does
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # Values orjson rejects but json accepts, e.g. ints over 64 bits
+            return _json_dumps(obj)
+
+    def _orjson_loads(data: bytes) -> Any:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # Payloads written by json.dumps may hold NaN/Infinity literals
+            return json.loads(data)
+
+    _default_encoder = _orjson_dumps
+    _default_decoder = _orjson_loads
+
+
+def _msgpack_dumps(obj: object) -> bytes:
+    data: bytes = msgpack.packb(obj, use_bin_type=True)
+    return data
+
+
+def _msgpack_loads(data: bytes) -> Any:
+    # The payload is written by this storage, so accept the non-str map
+    # keys packb() keeps. Malformed input raises ValueError subclasses.
+    return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+
+class _Codec(TypedDict):
+    encoder: Callable[[object], bytes]
+    decoder: Callable[[bytes], object]
+
+
+# Upper bound on the number of keys fetched by a single MGET
+_MAX_BATCH = 64
+
+# Browsers don't store cookies longer than this (RFC 6265, section 6.1)
+_MAX_KEY_LENGTH = 4096
+
+
+def _is_possible_key(key: str) -> bool:
+    # Identities can come from a custom key_factory or set_new_identity(),
+    # so only reject values no stored session can have.
+    return 0 < len(key) <= _MAX_KEY_LENGTH
+
+
+def _default_key_factory() -> str:
+    return os.urandom(16).hex()
+
+
+def _import_aioredis() -> None:
+    global aioredis
+    # Typed as the module for annotations, but None until first imported
+    if cast(Optional[ModuleType], aioredis) is not None:
+        return
+    try:
+        import aioredis as _aioredis
+    except ImportError:
+        raise RuntimeError("Please install aioredis") from None
+    version = tuple(int(x) for x in _aioredis.__version__.split('.')[:2])
+    if version < (2, 0):
+        raise RuntimeError("aioredis<2.0 is not supported")
+    aioredis = _aioredis
+
+
+_SaveFn = Callable[[web.Request, web.StreamResponse, Session], Awaitable[None]]
+
+
+def _make_save_fn(
+    redis: "aioredis.Redis",
+    encoder: Callable[[object], Union[str, bytes]],
+    prefix: bytes,
+    get_session_data: Callable[[Session], _SessionData],
+    load_cookie: Callable[[web.Request], Optional[str]],
+    save_cookie: Callable[..., None],
+    key_factory: Callable[[], str],
+    executor_threshold: Optional[int]
+) -> _SaveFn:
+    # The storage configuration is fixed after construction, so bind it
+    # into a closure once instead of looking it up on every save.
+
+    async def save_session(
+        request: web.Request,
+        response: web.StreamResponse,
+        session: Session
+    ) -> None:
+        max_age = session.max_age
+        key = session.identity
+        old_key = None
+        if key is None:
+            key = key_factory()
+            save_cookie(response, key, max_age=max_age)
+            # A fresh key replacing the request's cookie, e.g. new_session()
+            # on login: drop the superseded record along with the write.
+            old_key = load_cookie(request)
+            if old_key and not _is_possible_key(old_key):
+                # Never send a malformed cookie to Redis, not even as DEL
+                old_key = None
+        else:
+            if session.empty:
+                save_cookie(response, '', max_age=max_age)
+            else:
+                if not isinstance(key, str):
+                    key = str(key)
+                save_cookie(response, key, max_age=max_age)
+
+        session_data = get_session_data(session)
+        if executor_threshold is not None and len(session) > executor_threshold:
+            # The worker thread reads the live session, see the docs on
+            # executor_threshold about mutating it meanwhile.
+            loop = asyncio.get_running_loop()
+            data = await loop.run_in_executor(None, encoder, session_data)
+        else:
+            data = encoder(session_data)
+        if old_key and old_key != key:
+            pipe = redis.pipeline(transaction=False)
+            pipe.delete(prefix + old_key.encode('utf-8'))
+            pipe.set(prefix + key.encode('utf-8'), data,
+                     ex=max_age)  # type: ignore[arg-type]
+            await pipe.execute()
+        else:
+            await redis.set(prefix + key.encode('utf-8'), data,
+                            ex=max_age)  # type: ignore[arg-type]
+
+    return save_session
 
 
 class RedisStorage(AbstractStorage):
@@ -26,49 +181,146 @@ class RedisStorage(AbstractStorage):
         path: str = '/',
         secure: Optional[bool] = None,
         httponly: bool = True,
-        key_factory: Callable[[], str] = lambda: uuid.uuid4().hex,
-        encoder: Callable[[object], str] = json.dumps,
-        decoder: Callable[[str], Any] = json.loads
+        key_factory: Callable[[], str] = _default_key_factory,
+        encoder: Callable[[object], Union[str, bytes]] = _default_encoder,
+        decoder: Callable[[bytes], Any] = _default_decoder,
+        executor_threshold: Optional[int] = None,
+        fast_path: bool = False
     ) -> None:
         super().__init__(cookie_name=cookie_name, domain=domain,
                          max_age=max_age, path=path, secure=secure,
                          httponly=httponly,
-                         encoder=encoder, decoder=decoder)
-        if aioredis is None:
-            raise RuntimeError("Please install aioredis")
-        if StrictVersion(aioredis.__version__).version < (2, 0):
-            raise RuntimeError("aioredis<2.0 is not supported")
-        self._key_factory = key_factory
+                         encoder=encoder,  # type: ignore[arg-type]
+                         decoder=decoder)  # type: ignore[arg-type]
+        _import_aioredis()
+        self._key_prefix = (cookie_name + '_').encode('utf-8')
+        self._fast_path = fast_path
         if isinstance(redis_pool, aioredis.ConnectionPool):
             self._redis = aioredis.Redis(connection_pool=redis_pool)
         elif isinstance(redis_pool, aioredis.Redis):
             self._redis = redis_pool
         else:
             raise TypeError("Expected aioredis.Redis got {}".format(type(redis_pool)))
+        # Loads issued within one loop iteration are coalesced per key and
+        # fetched together with a single MGET.
+        self._inflight: Dict[str, "asyncio.Future[Optional[bytes]]"] = {}
+        self._pending: List[str] = []
+        self._flush_handle: Optional[asyncio.Handle] = None
+        self._fetches: Set["asyncio.Task[None]"] = set()
+        # The save path captures the client, encoder and the cookie and
+        # session-data helpers here; replacing them on the instance later
+        # has no effect on saving.
+        self._save_fn = _make_save_fn(
+            self._redis, encoder, self._key_prefix, self._get_session_data,
+            self.load_cookie, self.save_cookie, key_factory, executor_threshold)
+
+    @classmethod
+    def msgpack_defaults(cls) -> _Codec:
+        if msgpack is None:
+            raise RuntimeError("Please install msgpack")
+        return {"encoder": _msgpack_dumps, "decoder": _msgpack_loads}
 
-    def __del__(self):
-        asyncio.run(self._redis.close())
+    async def close(self) -> None:
+        # Abort loads still waiting on a batch before the client goes away
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        self._pending = []
+        for fut in self._inflight.values():
+            fut.cancel()
+        self._inflight.clear()
+        for task in self._fetches:
+            task.cancel()
+        await asyncio.gather(*self._fetches, return_exceptions=True)
+        await self._redis.close()  # type: ignore[no-untyped-call]
+
+    def _new_anon(self) -> Session:
+        # Sessions are mutable per request, so a fresh one every time
+        return Session(None, data=None, new=True, max_age=self._max_age)
 
     async def load_session(self, request: web.Request) -> Session:
         cookie = self.load_cookie(request)
         if cookie is None:
-            return Session(None, data=None, new=True, max_age=self.max_age)
+            return self._new_anon()
         else:
+            key = cookie
+            if not _is_possible_key(key):
+                return self._new_anon()
+            raw = await self._get(key)
+            if raw is None:
+                return self._new_anon()
+            # RedisStorage accepts bytes decoders, see __init__
+            decoder = cast(Callable[[bytes], Any], self._decoder)
             try:
-                async with await self._redis as conn:
-                    key = str(cookie)
-                    data = await conn.get(self.cookie_name + '_' + key)
-                    if data is None:
-                        return Session(None, data=None,
-                                       new=True, max_age=self.max_age)
-                    try:
-                        data = self._decoder(data)
-                    except ValueError:
-                        data = None
-                    return Session(key, data=data,
-                                   new=False, max_age=self.max_age)
-            except Exception as err:
-                raise
+                data = decoder(raw)
+            except ValueError:
+                data = None
+            return Session(key, data=data,
+                           new=False, max_age=self._max_age)
+
+    async def _get(self, key: str) -> Optional[bytes]:
+        fut = self._inflight.get(key)
+        if fut is None:
+            loop = asyncio.get_running_loop()
+            fut = loop.create_future()
+            self._inflight[key] = fut
+            self._pending.append(key)
+            if len(self._pending) >= _MAX_BATCH:
+                self._flush()
+            elif self._flush_handle is None:
+                self._flush_handle = loop.call_soon(self._flush)
+        # Shielded so that one cancelled caller doesn't fail the others
+        return await asyncio.shield(fut)
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        keys, self._pending = self._pending, []
+        if keys:
+            task = asyncio.ensure_future(self._fetch(keys))
+            self._fetches.add(task)
+            task.add_done_callback(self._fetches.discard)
+
+    async def _fetch(self, keys: List[str]) -> None:
+        inflight = self._inflight
+        prefix = self._key_prefix
+        futs = [inflight[key] for key in keys]
+        try:
+            full_keys = [prefix + key.encode('utf-8') for key in keys]
+            if self._fast_path:
+                values = await self._raw_mget(full_keys)
+            else:
+                values = await self._redis.mget(full_keys)
+        except Exception as exc:
+            for fut in futs:
+                if not fut.done():
+                    fut.set_exception(exc)
+        else:
+            for fut, value in zip(futs, values):
+                if not fut.done():
+                    fut.set_result(value)
+        finally:
+            for key, fut in zip(keys, futs):
+                if not fut.done():
+                    fut.cancel()
+                if inflight.get(key) is fut:
+                    del inflight[key]
+
+    async def _raw_mget(self, keys: List[bytes]) -> List[Optional[bytes]]:
+        # Talk to a pooled connection directly, skipping execute_command()
+        pool = self._redis.connection_pool
+        conn = await pool.get_connection('MGET')  # type: ignore[no-untyped-call]
+        try:
+            await conn.send_command('MGET', *keys)
+            values: List[Optional[bytes]] = await conn.read_response()
+        except BaseException:
+            # Don't hand a connection with an unread reply back to the pool
+            await conn.disconnect()
+            raise
+        finally:
+            await pool.release(conn)
+        return values
 
     async def save_session(
         self,
@@ -76,19 +328,4 @@ class RedisStorage(AbstractStorage):
         response: web.StreamResponse,
         session: Session
     ) -> None:
-        key = session.identity
-        if key is None:
-            key = self._key_factory()
-            self.save_cookie(response, key,
-                             max_age=session.max_age)
-        else:
-            if session.empty:
-                self.save_cookie(response, '',
-                                 max_age=session.max_age)
-            else:
-                key = str(key)
-                self.save_cookie(response, key,
-                                 max_age=session.max_age)
-
-        data = self._encoder(self._get_session_data(session))
-        await self._redis.set(self.cookie_name + '_' + key, data, ex=session.max_age)  # type: ignore[arg-type] # noqa: B950
+        await self._save_fn(request, response, session)
@@ -19,6 +19,8 @@ def read(f):
 install_requires = ['aiohttp>=3.0.1', 'typing_extensions>=3.7.4; python_version<"3.8"']
 extras_require = {
     'aioredis': ['aioredis>=2.0.0'],
+    'orjson': ['orjson'],
+    'msgpack': ['msgpack'],
     'aiomcache': ['aiomcache>=0.5.2'],
     'pycrypto': ['cryptography'],
     'secure': ['cryptography'],
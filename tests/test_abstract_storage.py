@@ -6,7 +6,8 @@ from unittest import mock
 from aiohttp import web
 from aiohttp.test_utils import TestClient
 from aiohttp.web_middlewares import _Handler
-from aiohttp_session import SimpleCookieStorage, get_session, setup as setup_middleware
+from aiohttp_session import (Session, SimpleCookieStorage, get_session,
+                             setup as setup_middleware)
 
 from .typedefs import AiohttpClient
 
@@ -46,3 +47,11 @@ async def test_max_age_also_returns_expires(aiohttp_client: AiohttpClient) -> No
         resp = await client.get('/')
         assert resp.status == 200
         assert "expires=Thu, 01-Jan-1970 00:00:10 GMT" in resp.headers["SET-COOKIE"]
+
+
+def test_get_session_data_does_not_copy_mapping() -> None:
+    storage = SimpleCookieStorage()
+    session = Session('id', data={'session': {'a': 1}}, new=False)
+    data = storage._get_session_data(session)
+    assert data == {'created': session.created, 'session': {'a': 1}}
+    assert data['session'] is session._mapping
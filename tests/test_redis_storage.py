@@ -1,15 +1,17 @@
 import asyncio
 import json
+import sys
 import time
 import uuid
 from typing import Any, Callable, Dict, MutableMapping, Optional, cast
 
 import aioredis
+import msgpack
 import pytest
 from aiohttp import web
-from aiohttp.test_utils import TestClient
+from aiohttp.test_utils import TestClient, make_mocked_request
 from aiohttp.web_middlewares import _Handler
-from aiohttp_session import Session, get_session, session_middleware
+from aiohttp_session import Session, get_session, new_session, session_middleware
 from aiohttp_session.redis_storage import RedisStorage
 from pytest_mock import MockFixture
 
@@ -127,6 +129,24 @@ async def test_load_bad_session(
     assert resp.status == 200
 
 
+async def test_load_json_non_finite_floats(
+    aiohttp_client: AiohttpClient,
+    redis: aioredis.Redis
+) -> None:
+
+    async def handler(request: web.Request) -> web.StreamResponse:
+        session = await get_session(request)
+        assert not session.new
+        assert session['f'] == float('inf')
+        return web.Response(body=b'OK')
+
+    client = await aiohttp_client(create_app(handler, redis))
+    # json.dumps writes Infinity, which orjson.loads rejects
+    await make_cookie(client, redis, {'f': float('inf')})
+    resp = await client.get('/')
+    assert resp.status == 200
+
+
 async def test_change_session(
     aiohttp_client: AiohttpClient,
     redis: aioredis.Redis
@@ -352,6 +372,7 @@ async def test_no_aioredis_installed(mocker: MockFixture) -> None:
         pass
 
     mocker.patch('aiohttp_session.redis_storage.aioredis', None)
+    mocker.patch.dict(sys.modules, {'aioredis': None})
     with pytest.raises(RuntimeError):
         create_app(handler=handler, redis=None)  # type: ignore[arg-type]
 
@@ -361,11 +382,9 @@ async def test_old_aioredis_version(mocker: MockFixture) -> None:
     async def handler(request: web.Request) -> web.StreamResponse:
         pass
 
-    class Dummy(object):
-        def __init__(self, *args: object, **kwargs: object) -> None:
-            self.version = (0, 3)
-
-    mocker.patch('aiohttp_session.redis_storage.StrictVersion', Dummy)
+    mocker.patch('aiohttp_session.redis_storage.aioredis', None)
+    mocker.patch.dict(sys.modules,
+                      {'aioredis': mocker.Mock(__version__='1.3.1')})
     with pytest.raises(RuntimeError):
         create_app(handler=handler, redis=None)  # type: ignore[arg-type]
 
@@ -396,3 +415,285 @@ async def test_load_session_dont_load_expired_session(
 
     resp = await client.get('/?exp=yes')
     assert resp.status == 200
+
+
+async def test_close_storage(redis: aioredis.Redis, mocker: MockFixture) -> None:
+    # redis before mocker, so close() is unpatched again by fixture teardown
+    storage = RedisStorage(redis)
+    close = mocker.patch.object(redis, 'close', mocker.AsyncMock())
+    await storage.close()
+    close.assert_awaited_once_with()
+
+
+async def test_load_session_with_new_identity(
+    aiohttp_client: AiohttpClient,
+    redis: aioredis.Redis
+) -> None:
+
+    async def handler(request: web.Request) -> web.StreamResponse:
+        session = await get_session(request)
+        if 'check' not in request.rel_url.query:
+            session.set_new_identity('user-42')
+            session['a'] = 1
+        else:
+            assert not session.new
+            assert session.identity == 'user-42'
+            assert cast(MutableMapping[str, Any], {'a': 1}) == session
+        return web.Response(body=b'OK')
+
+    app = web.Application(middlewares=[session_middleware(RedisStorage(redis))])
+    app.router.add_route('GET', '/', handler)
+    client = await aiohttp_client(app)
+    resp = await client.get('/')
+    assert resp.status == 200
+    assert resp.cookies['AIOHTTP_SESSION'].value == 'user-42'
+
+    resp = await client.get('/?check=1')
+    assert resp.status == 200
+
+
+async def test_malformed_cookie_skips_redis(
+    aiohttp_client: AiohttpClient,
+    redis: aioredis.Redis,
+    mocker: MockFixture
+) -> None:
+
+    async def handler(request: web.Request) -> web.StreamResponse:
+        session = await get_session(request)
+        assert session.new
+        return web.Response(body=b'OK')
+
+    mget = mocker.spy(redis, 'mget')
+    app = web.Application(middlewares=[session_middleware(RedisStorage(redis))])
+    app.router.add_route('GET', '/', handler)
+    client = await aiohttp_client(app)
+    # Ignoring type until aiohttp#4252 is released
+    client.session.cookie_jar.update_cookies(
+        {'AIOHTTP_SESSION': 'x' * 5000}  # type: ignore
+    )
+    resp = await client.get('/')
+    assert resp.status == 200
+    assert mget.call_count == 0
+
+
+async def test_new_session_drops_previous_key(
+    aiohttp_client: AiohttpClient,
+    redis: aioredis.Redis
+) -> None:
+
+    async def handler(request: web.Request) -> web.StreamResponse:
+        session = await new_session(request)
+        session['a'] = 1
+        return web.Response(body=b'OK')
+
+    client = await aiohttp_client(create_app(handler, redis))
+    await make_cookie(client, redis, {'a': 1, 'b': 2})
+    cookies = client.session.cookie_jar.filter_cookies(client.make_url('/'))
+    old_key = cookies['AIOHTTP_SESSION'].value
+    resp = await client.get('/')
+    assert resp.status == 200
+
+    new_key = resp.cookies['AIOHTTP_SESSION'].value
+    assert new_key != old_key
+    assert not await redis.exists('AIOHTTP_SESSION_' + old_key)
+    assert await redis.exists('AIOHTTP_SESSION_' + new_key)
+
+
+async def test_new_session_ignores_malformed_previous_cookie(
+    aiohttp_client: AiohttpClient,
+    redis: aioredis.Redis,
+    mocker: MockFixture
+) -> None:
+
+    async def handler(request: web.Request) -> web.StreamResponse:
+        session = await new_session(request)
+        session['a'] = 1
+        return web.Response(body=b'OK')
+
+    app = web.Application(middlewares=[session_middleware(RedisStorage(redis))])
+    app.router.add_route('GET', '/', handler)
+    client = await aiohttp_client(app)
+    # Ignoring type until aiohttp#4252 is released
+    client.session.cookie_jar.update_cookies(
+        {'AIOHTTP_SESSION': 'x' * 5000}  # type: ignore
+    )
+    pipeline = mocker.spy(redis, 'pipeline')
+    resp = await client.get('/')
+    assert resp.status == 200
+    assert pipeline.call_count == 0
+    key = resp.cookies['AIOHTTP_SESSION'].value
+    assert await redis.exists('AIOHTTP_SESSION_' + key)
+
+
+async def test_unchanged_session_is_not_saved(
+    aiohttp_client: AiohttpClient,
+    redis: aioredis.Redis,
+    mocker: MockFixture
+) -> None:
+
+    async def handler(request: web.Request) -> web.StreamResponse:
+        session = await get_session(request)
+        assert session['a'] == 1
+        return web.Response(body=b'OK')
+
+    client = await aiohttp_client(create_app(handler, redis))
+    await make_cookie(client, redis, {'a': 1})
+    set_ = mocker.spy(redis, 'set')
+    resp = await client.get('/')
+    assert resp.status == 200
+    assert set_.call_count == 0
+    assert 'AIOHTTP_SESSION' not in resp.cookies
+
+
+async def test_concurrent_loads_share_one_mget(
+    redis: aioredis.Redis,
+    mocker: MockFixture
+) -> None:
+    storage = RedisStorage(redis)
+    keys = [uuid.uuid4().hex for _ in range(3)]
+    for i, key in enumerate(keys):
+        value = json.dumps({'session': {'i': i}, 'created': int(time.time())})
+        await redis.set('AIOHTTP_SESSION_' + key, value)
+    requests = [
+        make_mocked_request('GET', '/', headers={'Cookie': 'AIOHTTP_SESSION=' + key})
+        for key in keys + keys
+    ]
+
+    mget = mocker.spy(redis, 'mget')
+    sessions = await asyncio.gather(*(storage.load_session(r) for r in requests))
+    assert mget.call_count == 1
+    assert len(mget.call_args[0][0]) == 3
+    assert [s['i'] for s in sessions] == [0, 1, 2, 0, 1, 2]
+    assert sessions[0] is not sessions[3]
+
+
+async def test_close_cancels_pending_loads(
+    redis: aioredis.Redis,
+    mocker: MockFixture
+) -> None:
+    mocker.patch.object(redis, 'close', mocker.AsyncMock())
+    storage = RedisStorage(redis)
+    request = make_mocked_request(
+        'GET', '/', headers={'Cookie': 'AIOHTTP_SESSION=' + uuid.uuid4().hex})
+    load = asyncio.ensure_future(storage.load_session(request))
+    await asyncio.sleep(0)
+    await storage.close()
+    with pytest.raises(asyncio.CancelledError):
+        await load
+    assert not storage._inflight
+    assert not storage._fetches
+
+
+async def test_large_session_encoded_in_executor(
+    aiohttp_client: AiohttpClient,
+    redis: aioredis.Redis,
+    mocker: MockFixture
+) -> None:
+
+    async def handler(request: web.Request) -> web.StreamResponse:
+        session = await get_session(request)
+        session.update({str(i): i for i in range(3)})
+        return web.Response(body=b'OK')
+
+    storage = RedisStorage(redis, executor_threshold=2)
+    app = web.Application(middlewares=[session_middleware(storage)])
+    app.router.add_route('GET', '/', handler)
+    client = await aiohttp_client(app)
+    run_in_executor = mocker.spy(asyncio.get_running_loop(), 'run_in_executor')
+    resp = await client.get('/')
+    assert resp.status == 200
+    assert run_in_executor.call_count == 1
+
+    value = await load_cookie(client, redis)
+    assert value['session'] == {'0': 0, '1': 1, '2': 2}
+
+
+async def test_msgpack_defaults(
+    aiohttp_client: AiohttpClient,
+    redis: aioredis.Redis
+) -> None:
+
+    async def handler(request: web.Request) -> web.StreamResponse:
+        session = await get_session(request)
+        if session.new:
+            session['a'] = [1, 'b']
+        else:
+            assert cast(MutableMapping[str, Any], {'a': [1, 'b']}) == session
+        return web.Response(body=b'OK')
+
+    storage = RedisStorage(redis, **RedisStorage.msgpack_defaults())
+    app = web.Application(middlewares=[session_middleware(storage)])
+    app.router.add_route('GET', '/', handler)
+    client = await aiohttp_client(app)
+    resp = await client.get('/')
+    assert resp.status == 200
+    key = resp.cookies['AIOHTTP_SESSION'].value
+    raw = await redis.get('AIOHTTP_SESSION_' + key)
+    assert msgpack.unpackb(raw, raw=False)['session'] == {'a': [1, 'b']}
+
+    resp = await client.get('/')
+    assert resp.status == 200
+
+
+async def test_msgpack_defaults_non_str_keys(
+    aiohttp_client: AiohttpClient,
+    redis: aioredis.Redis
+) -> None:
+
+    async def handler(request: web.Request) -> web.StreamResponse:
+        session = await get_session(request)
+        if 'check' not in request.rel_url.query:
+            session['cart'] = {1: 'x'}
+        else:
+            assert not session.new
+            assert session['cart'] == {1: 'x'}
+        return web.Response(body=b'OK')
+
+    storage = RedisStorage(redis, **RedisStorage.msgpack_defaults())
+    app = web.Application(middlewares=[session_middleware(storage)])
+    app.router.add_route('GET', '/', handler)
+    client = await aiohttp_client(app)
+    resp = await client.get('/')
+    assert resp.status == 200
+    resp = await client.get('/?check=1')
+    assert resp.status == 200
+
+
+async def test_fast_path_load(
+    aiohttp_client: AiohttpClient,
+    redis: aioredis.Redis,
+    mocker: MockFixture
+) -> None:
+
+    async def handler(request: web.Request) -> web.StreamResponse:
+        session = await get_session(request)
+        assert not session.new
+        assert cast(MutableMapping[str, Any], {'a': 1}) == session
+        return web.Response(body=b'OK')
+
+    storage = RedisStorage(redis, fast_path=True)
+    app = web.Application(middlewares=[session_middleware(storage)])
+    app.router.add_route('GET', '/', handler)
+    client = await aiohttp_client(app)
+    await make_cookie(client, redis, {'a': 1})
+    mget = mocker.spy(redis, 'mget')
+    resp = await client.get('/')
+    assert resp.status == 200
+    assert mget.call_count == 0
+
+
+async def test_fast_path_failure_discards_connection(
+    redis: aioredis.Redis,
+    mocker: MockFixture
+) -> None:
+    storage = RedisStorage(redis, fast_path=True)
+    mocker.patch.object(aioredis.Connection, 'read_response',
+                        side_effect=aioredis.ConnectionError)
+    disconnect = mocker.spy(aioredis.Connection, 'disconnect')
+    request = make_mocked_request(
+        'GET', '/', headers={'Cookie': 'AIOHTTP_SESSION=' + uuid.uuid4().hex})
+
+    with pytest.raises(aioredis.ConnectionError):
+        await storage.load_session(request)
+    assert disconnect.call_count == 1
+    assert not redis.connection_pool._in_use_connections